@@ -104,8 +104,7 @@ class ASTCodebaseParser(ASTFileParser):
 
     def _add_edges(self, parent: G) -> None:
         # connect import edges to their calls
-        for edge_from, edge_to in self._edges_to_add:
-            parent.add_edge(edge_from, edge_to)
+        self._add_delayed_edges(parent)
 
     def _add_delayed_assignment_edges(self, parent: G) -> None:
         # connect import edges to their calls
@@ -199,7 +198,7 @@ class ASTCodebaseParser(ASTFileParser):
                     ][0]
 
                     # if there is an identifier that matches an import, add an edge to the import
-                    self._edges_to_add.append((node_id, import_id))
+                    self._add_edge_later(node_id, import_id)
 
                     func_new = (txt if path not in txt else txt[txt.find(path)+1+len(path):]) \
                         if not import_id.startswith('aliased_import') \
@@ -234,16 +233,16 @@ class ASTCodebaseParser(ASTFileParser):
                         if imported_from in self._assignments:
                             if func_new in self._assignments[imported_from]:
                                 # add edge
-                                self._edges_to_add.append((node_id, self._assignments[imported_from][func_new][1]))
-                                self._edges_to_add.append((self._assignments[imported_from][func_new][1], node_id))
+                                self._add_edge_later(node_id, self._assignments[imported_from][func_new][1])
+                                self._add_edge_later(self._assignments[imported_from][func_new][1], node_id)
                         else:
                             self._delayed_assignment_edges_to_add.append((node_id, imported_from, func_new))
                         
                         if imported_from in self._function_definitions:
                             if func_new in self._function_definitions[imported_from]:
                                 # add edge
-                                self._edges_to_add.append((node_id, self._function_definitions[imported_from][func_new]))
-                                self._edges_to_add.append((self._function_definitions[imported_from][func_new], node_id))
+                                self._add_edge_later(node_id, self._function_definitions[imported_from][func_new])
+                                self._add_edge_later(self._function_definitions[imported_from][func_new], node_id)
                         else:
                             self._delayed_call_edges_to_add.append((node_id, imported_from, func_new))
         ### end handle other imports (constants) from other files ###
@@ -253,8 +252,8 @@ class ASTCodebaseParser(ASTFileParser):
             func = current_vertex.text
             if func in self._function_definitions[file]:
                 # add edge
-                self._edges_to_add.append((node_id, self._function_definitions[file][func]))
-                self._edges_to_add.append((self._function_definitions[file][func], node_id))
+                self._add_edge_later(node_id, self._function_definitions[file][func])
+                self._add_edge_later(self._function_definitions[file][func], node_id)
         ### end check if function is defined in the current file ###
         
         ### check if the function is part of an import in the current file ###
@@ -300,8 +299,8 @@ class ASTCodebaseParser(ASTFileParser):
                     if imported_from in self._function_definitions:
                         if func_new in self._function_definitions[imported_from]:
                             # add edge
-                            self._edges_to_add.append((node_id, self._function_definitions[imported_from][func_new]))
-                            self._edges_to_add.append((self._function_definitions[imported_from][func_new], node_id))
+                            self._add_edge_later(node_id, self._function_definitions[imported_from][func_new])
+                            self._add_edge_later(self._function_definitions[imported_from][func_new], node_id)
                     else:
                         self._delayed_call_edges_to_add.append((node_id, imported_from, func_new))
         ### end check if the function is part of an import in the current file ###
@@ -330,17 +329,17 @@ class ASTCodebaseParser(ASTFileParser):
                             if object_type in self._classes[file]:
                                 # connect call to local attribute definition (if it exists)
                                 if attribute_call in self._classes[file][object_type]:
-                                    self._edges_to_add.append((node_id, self._classes[file][object_type][attribute_call]))
-                                    self._edges_to_add.append((self._classes[file][object_type][attribute_call], node_id))
+                                    self._add_edge_later(node_id, self._classes[file][object_type][attribute_call])
+                                    self._add_edge_later(self._classes[file][object_type][attribute_call], node_id)
                                 # connect call to local class definition (if it exists)
                                 elif file in self._function_definitions:
                                     if object_type in self._function_definitions[file]:
-                                        self._edges_to_add.append((node_id, self._function_definitions[file][object_type]))
-                                        self._edges_to_add.append((self._function_definitions[file][object_type], node_id))
+                                        self._add_edge_later(node_id, self._function_definitions[file][object_type])
+                                        self._add_edge_later(self._function_definitions[file][object_type], node_id)
                                 # connect call to local assignment (if it exists)
                                 else:
-                                    self._edges_to_add.append((node_id, object_node_id))
-                                    self._edges_to_add.append((object_node_id, node_id))
+                                    self._add_edge_later(node_id, object_node_id)
+                                    self._add_edge_later(object_node_id, node_id)
 
                         # connect to other files if necessary
                         if file in self._imports:
@@ -360,12 +359,12 @@ class ASTCodebaseParser(ASTFileParser):
                                     if imported_from in self._classes:
                                         if type_ in self._classes[imported_from]:
                                             if attribute_call in self._classes[imported_from][type_]:
-                                                self._edges_to_add.append((node_id, self._classes[imported_from][type_][attribute_call]))
-                                                self._edges_to_add.append((self._classes[imported_from][type_][attribute_call], node_id))
+                                                self._add_edge_later(node_id, self._classes[imported_from][type_][attribute_call])
+                                                self._add_edge_later(self._classes[imported_from][type_][attribute_call], node_id)
                                             # connect to the class definition
                                             else:
-                                                self._edges_to_add.append((node_id, self._function_definitions[imported_from][type_]))
-                                                self._edges_to_add.append((self._function_definitions[imported_from][type_], node_id))
+                                                self._add_edge_later(node_id, self._function_definitions[imported_from][type_])
+                                                self._add_edge_later(self._function_definitions[imported_from][type_], node_id)
                                     else:
                                         self._delayed_class_attributes_to_add.append((node_id, imported_from, type_, attribute_call))
 
@@ -400,12 +399,12 @@ class ASTCodebaseParser(ASTFileParser):
                                         if txt in self._classes[imported_from]:
                                             # connect to the class definition
                                             if attribute_call in self._classes[imported_from][txt]:
-                                                self._edges_to_add.append((node_id, self._classes[imported_from][txt][attribute_call]))
-                                                self._edges_to_add.append((self._classes[imported_from][txt][attribute_call], node_id))
+                                                self._add_edge_later(node_id, self._classes[imported_from][txt][attribute_call])
+                                                self._add_edge_later(self._classes[imported_from][txt][attribute_call], node_id)
                                             # connect to the identifier definition
                                             else:
-                                                self._edges_to_add.append((node_id, self._function_definitions[imported_from][txt]))
-                                                self._edges_to_add.append((self._function_definitions[imported_from][txt], node_id))
+                                                self._add_edge_later(node_id, self._function_definitions[imported_from][txt])
+                                                self._add_edge_later(self._function_definitions[imported_from][txt], node_id)
                                     # add to edges to add later
                                     else:
                                         self._delayed_class_attributes_to_add.append((node_id, imported_from, txt, attribute_call))
@@ -421,8 +420,8 @@ class ASTCodebaseParser(ASTFileParser):
             if file in self._assignments:
                 if txt in self._assignments[file]:
                     # add edge
-                    self._edges_to_add.append((node_id, self._assignments[file][txt][1]))
-                    # self._edges_to_add.append((self._assignments[file][txt][1], node_id))
+                    self._add_edge_later(node_id, self._assignments[file][txt][1])
+                    # self._add_edge_later(self._assignments[file][txt][1], node_id)
         
         # copy all dictionaries for scoping
         if current_vertex.type in ['function_definition', 'class_definition'] or 'comprehension' in current_vertex.type or 'lambda' == current_vertex.type:
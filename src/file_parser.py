@@ -1,6 +1,8 @@
 import argparse
-import copy
+import collections
+import csv
 import gc
+import multiprocessing
 import os
 import re
 import sys
@@ -8,7 +10,6 @@ from typing import *
 
 import fasttext
 import fasttext.util
-import networkx as nx
 import numpy as np
 import pandas as pd
 import pygraphviz as pgv
@@ -31,6 +32,33 @@ PYTHON = Language(os.path.abspath(os.path.join(DIR, '../build/my-languages.so'))
 CONST = 10e-4
 FASTTEXT_MODEL_DIR = os.path.abspath(os.path.join(DIR, '../'))
 
+# interned node type strings (there are only a few hundred grammar symbols)
+_TYPE_INTERN : Dict[str, str] = {}
+
+# (row, column) location of a node
+_LOCATION = re.compile(r"\(([0-9]+),\s([0-9]+)\)")
+
+
+def locations_to_embed(rows: np.ndarray, cols: np.ndarray, dim: int) -> np.ndarray:
+    """
+        Sinusoidal encoding of (row, column) locations, one row of size dim per location.
+            The first half interleaves sin/cos of the row, the second half of the column
+    """
+    n = dim // 4
+    half = dim // 2
+    # geometric frequencies of the encoding
+    freqs = CONST ** (4 * np.arange(n) / dim)
+    x = np.outer(rows, freqs)
+    y = np.outer(cols, freqs)
+
+    # write straight into the strided columns of the result
+    res = np.zeros((len(rows), dim))
+    np.sin(x, out = res[:, 0:2*n:2])
+    np.cos(x, out = res[:, 1:2*n:2])
+    np.sin(y, out = res[:, half:half + 2*n:2])
+    np.cos(y, out = res[:, half + 1:half + 2*n:2])
+    return res
+
 
 class ASTFileParser():
 
@@ -44,7 +72,8 @@ class ASTFileParser():
         "_function_calls",
         "_imports",
         "_function_definitions",
-        "_edges_to_add",
+        "_edges_from",
+        "_edges_to",
         "_assignments",
         "_classes",
         "_delayed_assignment_edges_to_add",
@@ -91,8 +120,9 @@ class ASTFileParser():
 
         # track edges to be added at the end
         # don't add edges right away b/c ruins tree structure and traversal
-        # (node_id_to, node_id_from)
-        self._edges_to_add : List[Tuple[str, str]] = []
+        # parallel lists of node_id_from and node_id_to
+        self._edges_from : List[str] = []
+        self._edges_to : List[str] = []
 
         # track assignments
         # key: file name
@@ -114,11 +144,13 @@ class ASTFileParser():
         self._delayed_class_attributes_to_add : List[Tuple[str, str, str, str]] = []
     
     def _copy_for_scope(self) -> List[Dict]:
+        # keys and leaf values are immutable (str and tuple of str),
+        # so copying the nested dicts is equivalent to a deep copy
         return [
-            copy.deepcopy(self._function_calls),
-            copy.deepcopy(self._function_definitions),
-            copy.deepcopy(self._assignments),
-            copy.deepcopy(self._classes),
+            {k: v.copy() for k, v in self._function_calls.items()},
+            {k: v.copy() for k, v in self._function_definitions.items()},
+            {k: v.copy() for k, v in self._assignments.items()},
+            {k: {k2: v2.copy() for k2, v2 in v.items()} for k, v in self._classes.items()},
         ]
     
     def _cleanup(self) -> None:
@@ -132,7 +164,8 @@ class ASTFileParser():
         self._function_calls.clear()
         self._imports.clear()
         self._function_definitions.clear()
-        self._edges_to_add.clear()
+        self._edges_from.clear()
+        self._edges_to.clear()
         self._assignments.clear()
         self._classes.clear()
         self._delayed_assignment_edges_to_add.clear()
@@ -159,76 +192,95 @@ class ASTFileParser():
         return self._parser.parse(bytes(file, "utf8"))
     
     def parse(self) -> str:
-    
-        def _parse_node(node: Node, parent: G, last_node: Union[N, None], filename: str) -> str:
-            # add text if node is terminal
-            text = None
-            if node.is_named and len(node.children) == 0:
-                text = node.text.decode("utf-8")
-            if node.type == 'binary_operator':
-                text = node.children[1].text.decode("utf-8")
-            # add text to attribute nodes
-            if node.type == 'attribute':
-                text = node.text.decode("utf-8")            
-            
-            name = node.type if not text else node.type + ' | ' + text
-
-            # TODO: does this make this better or worse?
-            # condense dotted attributes
-            # if node.type == 'attribute':                
-            #     text = node.text.decode('utf-8')
-            #     name = 'identifier | ' + text
-
-            # add file name to root node
-            if node.type == 'module':
-                name = node.type + ' | ' + self._filepath
-            else:
-                if name not in self._counts:
-                    self._counts[name] = 0
-                    name = name + '_' + str(self._counts[name])
+        parent : G = self._AST
+        filename : str = self._filepath
+
+        # iterative pre-order walk over the syntax tree
+        # parents[-1] is the node of the cursor's parent in the AST
+        cursor = self._root.walk()
+        parents : List[N] = []
+        root_id = None
+
+        while True:
+            node : Node = cursor.node
+
+            # only use named nodes (the root is always used)
+            if node.is_named or not parents:
+                last_node = parents[-1] if parents else None
+
+                type_ = _TYPE_INTERN.get(node.type)
+                if type_ is None:
+                    type_ = _TYPE_INTERN[node.type] = sys.intern(node.type)
+
+                # add text if node is terminal or an attribute
+                # (decoded once and reused for the rest of the node)
+                text = None
+                if type_ == 'attribute' or (node.is_named and node.child_count == 0):
+                    text = node.text.decode("utf-8")
+                elif type_ == 'binary_operator':
+                    text = node.children[1].text.decode("utf-8")
+
+                # TODO: does this make this better or worse?
+                # condense dotted attributes
+                # if node.type == 'attribute':                
+                #     text = node.text.decode('utf-8')
+                #     name = 'identifier | ' + text
+
+                # add file name to root node
+                if type_ == 'module':
+                    name = f'{type_} | {self._filepath}'
                 else:
-                    self._counts[name] += 1
-                    name = name + '_' + str(self._counts[name])
-            
-            n_ = N(name, node.start_point, node.end_point, filename, type = node.type, parent = last_node)
-            if text:
-                n_.text = text
-
-            # if node.type == 'attribute':
-            #     n_.type = 'identifier'
-            #     id = parent.add_vertex(n_)
-            #     return id
-
-            # add the node to the graph
-            id = parent.add_vertex(n_)
-
-            # track variable name for identifier nodes
-            if node.type == 'identifier':
-                n_.var_name = node.text.decode("utf-8")
-
-            # handle function calls
-            if node.type == 'call' and node.children[0].text.decode("utf-8") not in self.BUILTINS:
-                self._handle_call(node, parent, name)
-
-            # handle imports
-            if node.type == "aliased_import" or \
-                (node.type == "dotted_name" and node.parent.type.startswith("import")):
-                self._handle_import(node, parent, name)
-
-            # handle function definitions
-            if node.type == 'function_definition' or node.type == 'class_definition':
-                self._handle_definition(node, parent, name)
-            
-            for child in node.children:
-                # only use named nodes
-                if not child.is_named:
+                    # number the nodes per type
+                    count = self._counts.get(type_, -1) + 1
+                    self._counts[type_] = count
+                    name = f'{type_} | {text}_{count}' if text else f'{type_}_{count}'
+                
+                n_ = N(name, node.start_point, node.end_point, filename, type = type_, parent = last_node)
+                if text:
+                    n_.text = text
+
+                # if node.type == 'attribute':
+                #     n_.type = 'identifier'
+                #     id = parent.add_vertex(n_)
+                #     return id
+
+                # add the node to the graph and connect it to its parent
+                id = parent.add_vertex(n_)
+                if last_node:
+                    parent.add_edge(last_node.id, id)
+                else:
+                    root_id = id
+
+                # track variable name for identifier nodes (always terminal)
+                if type_ == 'identifier':
+                    n_.var_name = text
+
+                # handle function calls
+                if type_ == 'call':
+                    function_name = node.children[0].text.decode("utf-8")
+                    if function_name not in self.BUILTINS:
+                        self._handle_call(function_name, parent, name)
+
+                # handle imports
+                if type_ == "aliased_import" or \
+                    (type_ == "dotted_name" and node.parent.type.startswith("import")):
+                    self._handle_import(node, parent, name)
+
+                # handle function definitions
+                if type_ == 'function_definition' or type_ == 'class_definition':
+                    self._handle_definition(node, parent, name)
+
+                # descend into the children
+                if cursor.goto_first_child():
+                    parents.append(n_)
                     continue
-                to_id_ = _parse_node(child, parent, last_node = n_, filename=filename)
-                parent.add_edge(n_.id, to_id_)
-            
-            return id
-    
-        root_id = _parse_node(self._root, self._AST, last_node = None, filename = self._filepath)
+
+            # move to the next sibling, climbing back up until one exists
+            while parents and not cursor.goto_next_sibling():
+                cursor.goto_parent()
+                parents.pop()
+            if not parents:
+                break
 
         # check if this is a file or dir parser
         if type(self) == ASTFileParser:
@@ -236,28 +288,27 @@ class ASTFileParser():
 
         return root_id
 
-    def _handle_call(self, node: Node, parent: G, id: str) -> None:
-        # get function name
-        function_name = node.children[0].text.decode("utf-8")
+    def _handle_call(self, function_name: str, parent: G, id: str) -> None:
         # add function call to dict
-        if self._filepath not in self._function_calls:
-            self._function_calls[self._filepath] = {function_name: id}
-        else:
-            self._function_calls[self._filepath][function_name] = id
+        self._function_calls.setdefault(self._filepath, {})[function_name] = id
 
         # add edge from the call to the import statment if it exists
         self._call_to_import(function_name, parent, id)
     
     def _call_to_import(self, function_call: str, parent: G, id: str) -> None:
-        if self._filepath in self._imports and function_call in self._imports[self._filepath]:
-            # parent.add_edge(id, self._imports[self._filepath][function_call])
-            self._edges_to_add.append((id, self._imports[self._filepath][function_call][0]))
+        imports = self._imports.get(self._filepath)
+        if not imports:
             return
-        if '.' in function_call:
-            # function_name = function_name if len(function_name.split('.')) <= 1 else function_name.split('.')[0]
-            # TODO: fix this to work with attributes
-            function_call = function_call[:function_call.rfind('.')]
-            self._call_to_import(function_call, parent, id)
+        # drop trailing attributes until the call matches an import
+        # TODO: fix this to work with attributes
+        while True:
+            import_ = imports.get(function_call)
+            if import_ is not None:
+                self._add_edge_later(id, import_[0])
+                return
+            function_call, sep, _ = function_call.rpartition('.')
+            if not sep:
+                return
         
     def _handle_import(self, node: Node, parent: G, id: str) -> None:
         if node.type == 'aliased_import':
@@ -278,21 +329,16 @@ class ASTFileParser():
             import_name = [(node.text.decode("utf-8"), id, import_path)]
             
         # add import to dict
+        imports = self._imports.setdefault(self._filepath, {})
         for import_, id_, import_path_ in import_name:
             # get import location
-            if self._filepath not in self._imports:
-                self._imports[self._filepath] = {import_: (id_, import_path_)}
-            else:
-                self._imports[self._filepath][import_] = (id_, import_path_)
+            imports[import_] = (id_, import_path_)
 
     def _handle_definition(self, node: Node, parent: G, id: str) -> None:
         # get function name
         function_name = node.children[1].text.decode("utf-8")
         # add function definition to dict
-        if self._filepath not in self._function_definitions:
-            self._function_definitions[self._filepath] = {function_name: id}
-        else:
-            self._function_definitions[self._filepath][function_name] = id
+        self._function_definitions.setdefault(self._filepath, {})[function_name] = id
 
     # TODO: make this work with single files again
     def _resolve_imports(self, parent: G) -> None:
@@ -310,8 +356,17 @@ class ASTFileParser():
                 parent.add_edge(self._function_definitions[self._filepath][function_name], self._function_calls[self._filepath][function_name])
 
         # add import edges at the end
-        for edge_from, edge_to in self._edges_to_add:
-            parent.add_edge(edge_from, edge_to)
+        self._add_delayed_edges(parent)
+
+    def _add_edge_later(self, edge_from: str, edge_to: str) -> None:
+        self._edges_from.append(edge_from)
+        self._edges_to.append(edge_to)
+
+    def _add_delayed_edges(self, parent: G) -> None:
+        # both ends were added to the graph when they were parsed
+        vert_dict = parent.vert_dict
+        for edge_from, edge_to in zip(self._edges_from, self._edges_to):
+            vert_dict[edge_from].add_neighbor(vert_dict[edge_to])
 
     def save_dot_format(self, filepath: str = 'tree.gv') -> str:
         if not self._AST:
@@ -320,11 +375,9 @@ class ASTFileParser():
     
     def _get_dot_format(self, filepath: str) -> str:
         edges = []
-        nodes_ : List[str] = self._AST.get_vertices()
         nodes = []
 
-        for node in nodes_:
-            n_ : N = self._AST.get_vertex(node)
+        for n_ in self._AST:
             nodes.append((n_.id, n_._start, n_._end))
             
             for child in n_.get_connections():
@@ -350,14 +403,12 @@ class ASTFileParser():
         return self._convert_to_graphviz()
     
     def _convert_to_graphviz(self) -> pgv.AGraph:
-        nodes = self._AST.get_vertices()
         edges = []
         # g = Digraph('G', filename='tree.gv')
         g = pgv.AGraph(strict=True, directed=True)
 
 
-        for node in nodes:
-            n : N = self._AST.get_vertex(node)
+        for n in self._AST:
             g.add_node(
                 n.id,
                 xlabel=f'{n._start}->{n._end}',
@@ -374,50 +425,67 @@ class ASTFileParser():
         self._to_csv(nf, adj)
 
     def _to_csv(self, nf: str, adj: str) -> None:
-        g : pgv.AGraph = self.convert_to_graphviz()
-        g : nx.DiGraph = nx.nx_agraph.from_agraph(g)
-
-        nodes = (n for n in g.nodes())
-        feats = (feat['xlabel'] for node, feat in dict(g.nodes(data=True)).items())
-        files = (feat['label'] for node, feat in dict(g.nodes(data=True)).items())
-        node_feats = pd.DataFrame({'node': nodes, 'feat': feats, 'file': files})
-        node_feats.to_csv(f"{nf}.csv", index = False)
+        # stream the node features straight from the AST
+        with open(f"{nf}.csv", 'w', newline = '') as f:
+            writer = csv.writer(f, lineterminator = '\n')
+            writer.writerow(('node', 'feat', 'file'))
+            writer.writerows((n.id, f'{n._start}->{n._end}', n.file) for n in self._AST)
         print(f'Saved node features to {nf}.csv')
-        del node_feats
-        del nodes
-        del feats
-        del files
-        adj_sparse = nx.to_scipy_sparse_array(g, dtype = np.bool_, weight = None)
+        adj_sparse = self._to_sparse_adjacency()
         scipy.sparse.save_npz(adj, adj_sparse)
         print(f'Saved adjacency matrix to {adj}.npz')
         del adj_sparse
         gc.collect()
 
-    def _to_networkx(self) -> nx.DiGraph:
-        g : pgv.AGraph = self.convert_to_graphviz()
-        return nx.nx_agraph.from_agraph(g)
+    def _to_sparse_adjacency(self) -> scipy.sparse.csr_array:
+        # rows and columns follow the vertex indices (same order as the node features)
+        indptr, indices = self._AST.to_csr()
+        adj_sparse = scipy.sparse.csr_array(
+            (np.ones(len(indices), dtype = np.bool_), indices, indptr),
+            shape = (self._AST.num_vertices, self._AST.num_vertices),
+        )
+        adj_sparse.sort_indices()
+        return adj_sparse
 
     def view_k_neighbors(self,
                          node_id: str,
                          k: int = 10
                         ) -> None:
-        g : nx.DiGraph = self._to_networkx()
-        g_k = pgv.AGraph(strict=True, directed=True)
-        g_k.add_node(node_id)
-
-        depth = 0
-
-        def neighbors(g: nx.DiGraph, node_id: str, depth: int) -> None:
+        root : N = self._AST.get_vertex(node_id)
+        if root is None:
+            raise Exception(f"Vertex {node_id} not in graph.")
+
+        # breadth first search for all edges leaving nodes less than k away
+        edges : List[Tuple[str, str]] = []
+        visited : Set[str] = {root.id}
+        queue : Deque[Tuple[N, int]] = collections.deque([(root, 0)])
+        while queue:
+            n, depth = queue.popleft()
             if depth >= k:
-                return
-            depth += 1
-            for neighbor in g.neighbors(node_id):
-                g_k.add_edge(node_id, neighbor)
-                neighbors(g, neighbor, depth)
-
-        neighbors(g, node_id, depth)
-
-        g_k.write('tree.gv')
+                continue
+            for neighbor in n.get_connections():
+                edges.append((n.id, neighbor.id))
+                if neighbor.id not in visited:
+                    visited.add(neighbor.id)
+                    queue.append((neighbor, depth + 1))
+
+        def quote(id: str) -> str:
+            # DOT only unescapes \" and keeps every other backslash as is, so only
+            # a run of backslashes right before a quote (or the closing quote) has to
+            # be made even. Odd runs there come back with one extra backslash
+            return '"' + re.sub(
+                r'(\\*)("|\Z)',
+                lambda m: m.group(1) + '\\' * (len(m.group(1)) % 2) + ('\\"' if m.group(2) else ''),
+                id,
+            ) + '"'
+
+        # write the neighborhood in Graphviz DOT format
+        with open('tree.gv', 'w') as f:
+            f.write('strict digraph tree {\n')
+            f.write(f'    {quote(root.id)};\n')
+            for edge_from, edge_to in edges:
+                f.write(f'    {quote(edge_from)} -> {quote(edge_to)};\n')
+            f.write('}\n')
 
     def csv_features_to_vectors(self, nf: str) -> None:
         # check that the files exist
@@ -440,51 +508,90 @@ class ASTFileParser():
         self._ft = ft
 
         # define the embedding functions
-        def location_to_embed(location: str) -> np.ndarray:
-            dim = self._dim // 4
-            # get number between first parentheses and comma
-            x = int(re.search(r"\(([0-9]+),", location).groups()[0])
-            y = int(re.search(r",\s([0-9]+)\)", location).groups()[0])
-            res = np.zeros(dim)
-            i = np.arange(dim // 4)
-            res[2*i] = np.sin(x * CONST ** (4 * i / dim))
-            res[2*i + 1] = np.cos(x * CONST ** (4 * i / dim))
-            res[2*i + dim // 2] = np.sin(y * CONST ** (4 * i / dim))
-            res[2*i + dim // 2 + 1] = np.cos(y * CONST ** (4 * i / dim))
-            return res
-
-        def type_to_embed(type_: str, ft: fasttext.FastText._FastText) -> np.ndarray:
-            return ft.get_word_vector(type_)
-        
-        def text_to_embed(text: str, ft: fasttext.FastText._FastText) -> np.ndarray:
-            return ft.get_word_vector(text)
-        
-        def embed(start: str, end: str, type_: str, text: str, ft: fasttext.FastText._FastText) -> np.ndarray:
-            return np.concatenate([location_to_embed(start), location_to_embed(end), type_to_embed(type_, ft), text_to_embed(text, ft)], axis = 0)
+        def tokens_to_embed(tokens: pd.Series, ft: fasttext.FastText._FastText) -> np.ndarray:
+            # node types and texts repeat a lot so only embed each distinct token once
+            vectors = {token: ft.get_word_vector(token) for token in tokens.unique()}
+            return np.stack(tokens.map(vectors).to_numpy())
 
         def get_node_text(node_id: str) -> str:
-            return '' if ' | ' not in node_id else (node_id.split(' | ')[1] if not re.match(r"(.*)(_[0-9]+$)", node_id.split(' | ')[1]) else re.match(r"(.*)(_[0-9]+$)", node_id.split(' | ')[1]).groups()[0])
+            if ' | ' not in node_id:
+                return ''
+            text = node_id.split(' | ')[1]
+            # remove the node count suffix
+            head, sep, count = text.rpartition('_')
+            return head if sep and count.isdigit() else text
         
         def get_node_type(node_id: str) -> str:
             return node_id[:node_id.rfind('_')] if ' | ' not in node_id else node_id.split(' | ')[0]
 
         # extract features to columns
-        df['start'] = df['feat'].apply(lambda x: x.split('->')[0])
-        df['end'] = df['feat'].apply(lambda x: x.split('->')[1])
+        locations = df['feat'].str.split('->', n = 1, expand = True)
+        df['start'] = locations[0]
+        df['end'] = locations[1]
         df['text'] = df['node'].apply(lambda x: get_node_text(x))
         df['type'] = df['node'].apply(lambda x: get_node_type(x))
 
-        feats = df.apply(
-            lambda row: embed(row.start, row.end, row.type, row.text, self._ft),
-            axis = 1,
-            result_type = "expand"
-        )
+        # get the numbers between the parentheses of every location
+        start = df['start'].str.extract(_LOCATION).astype(np.int64).to_numpy()
+        end = df['end'].str.extract(_LOCATION).astype(np.int64).to_numpy()
+
+        feats = pd.DataFrame(np.hstack([
+            locations_to_embed(start[:, 0], start[:, 1], self._dim // 4),
+            locations_to_embed(end[:, 0], end[:, 1], self._dim // 4),
+            tokens_to_embed(df['type'], self._ft),
+            tokens_to_embed(df['text'], self._ft),
+        ]))
         feats['start'] = df['start']
         feats['end'] = df['end']
         feats['file'] = df['file']
         feats.index = df['node']
         feats.to_csv(f"{nf}.csv")
 
+def _parse_one(filepath: str) -> Tuple[np.ndarray, np.ndarray, List[Tuple[str, str, str]]]:
+    """
+        Parse a single file and return its adjacency in CSR form (indptr, indices)
+            and its (node, feat, file) records. Only arrays and tuples are returned
+            so the result pickles cheaply (nodes hold references to their parents)
+    """
+    ast = ASTFileParser(filepath)
+    ast.parse()
+    indptr, indices = ast.AST.to_csr()
+    records = [(n.id, f'{n._start}->{n._end}', n.file) for n in ast.AST]
+    return indptr, indices, records
+
+def parse_files(filepaths: List[str],
+                processes: Optional[int] = None,
+                chunksize: int = 8,
+               ) -> Tuple[scipy.sparse.csr_array, List[Tuple[str, str, str]]]:
+    """
+        Parse every file with its own ASTFileParser across a pool of processes.
+            Files are not connected to each other so the adjacency is block diagonal,
+            node names are only unique together with their file
+    """
+    indptrs : List[np.ndarray] = [np.zeros(1, dtype = np.int64)]
+    indices : List[np.ndarray] = []
+    records : List[Tuple[str, str, str]] = []
+    num_nodes = 0
+    num_edges = 0
+
+    with multiprocessing.Pool(processes) as pool:
+        # keep the order of the files so the output is reproducible
+        for indptr_, indices_, records_ in pool.imap(_parse_one, filepaths, chunksize = chunksize):
+            # shift the node indices of this file after the previous files
+            indptrs.append(indptr_[1:] + num_edges)
+            indices.append(indices_ + num_nodes)
+            records.extend(records_)
+            num_nodes += len(records_)
+            num_edges += int(indptr_[-1])
+
+    indices_all = np.concatenate(indices) if indices else np.zeros(0, dtype = np.int64)
+    adj_sparse = scipy.sparse.csr_array(
+        (np.ones(len(indices_all), dtype = np.bool_), indices_all, np.concatenate(indptrs)),
+        shape = (num_nodes, num_nodes),
+    )
+    adj_sparse.sort_indices()
+    return adj_sparse, records
+
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument("--file", type=str, required=True, help="Path to file to parse")
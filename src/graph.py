@@ -1,6 +1,8 @@
 import gc
 import typing as th
 
+import numpy as np
+
 
 class Node:
 
@@ -14,6 +16,7 @@ class Node:
         '_var_name',
         '_adjacent',
         '_parent',
+        '_index',
     ]
 
     def __init__(self, 
@@ -32,8 +35,11 @@ class Node:
         self._text = text
         self._type = type
         self._var_name = var_name
-        self._adjacent : th.Dict[Node, int] = {}
+        # insertion ordered set of neighbors, repeated edges are kept once
+        self._adjacent : th.Dict[Node, None] = {}
         self._parent = parent
+        # position of the node in the graph, set by Graph.add_vertex
+        self._index : th.Optional[int] = None
 
     @property
     def id(self) -> str:
@@ -75,6 +81,10 @@ class Node:
     def var_name(self, value: str) -> None:
         self._var_name = value
     
+    @property
+    def index(self) -> th.Optional[int]:
+        return self._index
+
     @property
     def parent(self) -> th.Optional['Node']:
         return self._parent
@@ -88,35 +98,44 @@ class Node:
     def __str__(self) -> str:
         return str(self.id) + ' adjacent: ' + str([x.id for x in self._adjacent])
 
-    def add_neighbor(self, neighbor: "Node", weight : float = 1.) -> None:
-        self._adjacent[neighbor] = weight
+    def add_neighbor(self, neighbor: "Node") -> None:
+        self._adjacent[neighbor] = None
 
-    def get_connections(self) -> th.List["Node"]:
+    def get_connections(self) -> th.Iterable["Node"]:
         return self._adjacent.keys()
-
-    def get_weight(self, neighbor: "Node") -> float:
-        return self._adjacent[neighbor]
     
     def get_descendants(self) -> th.List["Node"]:
+        # iterative pre-order traversal
+        # delayed edges (call <-> definition, assignment <-> use) create cycles
+        # so every node is only visited once
         descendants : th.List["Node"] = []
-        for neighbor in self.get_connections():
-            descendants.append(neighbor)
-            descendants.extend(neighbor.get_descendants())
+        seen : th.Set["Node"] = {self}
+        stack : th.List["Node"] = list(reversed(self._adjacent))
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            descendants.append(node)
+            stack.extend(reversed(node._adjacent))
         return descendants
 
 class Graph:
 
     __slots__ = [
         'vert_dict',
+        'vert_list',
         'num_vertices',
     ]
 
     def __init__(self) -> None:
         self.vert_dict : th.Dict[str: Node]= {}
+        # vertices by integer index, in insertion order
+        self.vert_list : th.List[Node] = []
         self.num_vertices : int = 0
     
     def __iter__(self) -> th.Iterator[Node]:
-        return iter(self.vert_dict.values())
+        return iter(self.vert_list)
     
     def __str__(self) -> str:
         return '----------\n' + \
@@ -128,8 +147,13 @@ class Graph:
         if node.parent:
             if node.parent.id not in self.vert_dict:
                 raise Exception(f"Parent {node.parent.id} not in graph.")
+        # _index and vert_list assume every id is added once
+        if node.id in self.vert_dict:
+            raise Exception(f"Vertex {node.id} already in graph.")
+        node._index = self.num_vertices
         self.num_vertices = self.num_vertices + 1
         self.vert_dict[node.id] = node
+        self.vert_list.append(node)
 
         return node.id
 
@@ -139,18 +163,37 @@ class Graph:
         else:
             return None
         
-    def add_edge(self, from_: str, to_: str, weight: float = 1, bi: bool = False) -> None:
+    def add_edge(self, from_: str, to_: str, bi: bool = False) -> None:
         if from_ not in self.vert_dict:
             raise Exception(f"Vertex {from_} not in graph.")
         if to_ not in self.vert_dict:
             raise Exception(f"Vertex {to_} not in graph.")
-        self.vert_dict[from_].add_neighbor(self.vert_dict[to_], weight)
+        self.vert_dict[from_].add_neighbor(self.vert_dict[to_])
         if bi:
-            self.vert_dict[to_].add_neighbor(self.vert_dict[from_], weight)
+            self.vert_dict[to_].add_neighbor(self.vert_dict[from_])
     
     def get_vertices(self) -> th.List[str]:
         return list(self.vert_dict.keys())
     
+    def to_csr(self) -> th.Tuple[np.ndarray, np.ndarray]:
+        """
+            Adjacency of the graph in CSR form (indptr, indices),
+                rows and columns are the vertex indices
+        """
+        degrees = np.fromiter(
+            (len(node._adjacent) for node in self.vert_list),
+            dtype = np.int64,
+            count = len(self.vert_list),
+        )
+        indptr = np.zeros(len(self.vert_list) + 1, dtype = np.int64)
+        np.cumsum(degrees, out = indptr[1:])
+        indices = np.fromiter(
+            (neighbor._index for node in self.vert_list for neighbor in node._adjacent),
+            dtype = np.int64,
+            count = indptr[-1],
+        )
+        return indptr, indices
+
     def get_parent(self, id: str) -> Node:
         return self.vert_dict[id].parent
 
@@ -174,6 +217,7 @@ class Graph:
             node._adjacent.clear()
             del node
         self.vert_dict.clear()
+        self.vert_list.clear()
         self.num_vertices = 0
         gc.collect()
 
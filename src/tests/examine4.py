@@ -0,0 +1,11 @@
+from examine3 import TestClass
+
+# strings with escape sequences
+quoted = "a \"quoted\" string"
+path = 'C:\\temp\\new'
+lines = "one\ntwo\tthree\\"
+
+print(quoted, path, lines)
+print(TestClass(4))
+
+# a comment that ends with a backslash \